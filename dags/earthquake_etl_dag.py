@@ -3,8 +3,13 @@ from airflow import DAG
 from airflow.operators.python import PythonOperator
 from airflow.providers.postgres.operators.postgres import PostgresOperator
 from airflow.providers.postgres.hooks.postgres import PostgresHook
+from psycopg2.extras import execute_values
+import psycopg2
 import requests
-import json
+import orjson
+import ijson
+import os
+import gzip
 import logging
 
 # Default arguments
@@ -18,6 +23,16 @@ default_args = {
     'retry_delay': timedelta(minutes=5),
 }
 
+# Directory used to hand extracted payloads from extract to load
+EXTRACT_DIR = '/tmp'
+
+# Read/write block size when streaming payloads
+CHUNK_SIZE = 64 * 1024
+
+# Bytes psycopg2 pulls from the row stream per COPY FROM message. Larger
+# blocks mean fewer round-trips into libpq; tunable per deployment
+COPY_BLOCK_BYTES = int(os.environ.get('COPY_BLOCK_BYTES', 1 << 20))
+
 # DAG definition
 dag = DAG(
     'earthquake_elt_pipeline',
@@ -47,16 +62,32 @@ def extract_earthquake_data(**context):
         }
         
         logging.info(f"Fetching earthquake data from {start_time} to {end_time}")
-        response = requests.get(url, params=params, timeout=30)
-        response.raise_for_status()
+        # Stream the payload to a file for the load task instead of passing
+        # it through XCom, which would serialize it through the Airflow
+        # metadata database. Multi-worker deployments should point this at
+        # shared storage.
+        data_path = f"{EXTRACT_DIR}/earthquake_{context['ts_nodash']}.json.gz"
         
-        data = response.json()
-        earthquake_count = len(data.get('features', []))
+        # requests' default Accept-Encoding already offers gzip, and adds br
+        # when brotli is installed, so only the User-Agent is set here
+        with requests.Session() as session:
+            session.headers.update({'User-Agent': 'earthquake-etl/1.0'})
+            response = session.get(url, params=params, timeout=30, stream=True)
+            response.raise_for_status()
+            
+            with gzip.open(data_path, 'wb') as f:
+                for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                    f.write(chunk)
         
-        logging.info(f"Successfully extracted {earthquake_count} earthquakes")
+        # USGS puts the event count in the metadata block ahead of the
+        # features, so this stops reading early
+        with gzip.open(data_path, 'rb') as f:
+            earthquake_count = next(ijson.items(f, 'metadata.count'), 0)
         
-        # Push to XCom for next task
-        context['ti'].xcom_push(key='earthquake_data', value=data)
+        logging.info(f"Successfully extracted {earthquake_count} earthquakes to {data_path}")
+        
+        # Push only the file location to XCom for next task
+        context['ti'].xcom_push(key='data_path', value=data_path)
         context['ti'].xcom_push(key='record_count', value=earthquake_count)
         
         return earthquake_count
@@ -65,6 +96,86 @@ def extract_earthquake_data(**context):
         logging.error(f"Extract failed: {str(e)}")
         raise
 
+class FeatureCopyStream:
+    """
+    File-like object that formats COPY rows as features are parsed,
+    so the payload is never held in memory as a whole
+    """
+    def __init__(self, features):
+        self._rows = (self._format_row(feature) for feature in features)
+        self._buffer = bytearray()
+    
+    @staticmethod
+    def _format_row(feature):
+        # orjson emits UTF-8 bytes directly, which is what COPY consumes.
+        # Backslashes are the escape character in COPY text format
+        raw_json = orjson.dumps(feature).replace(b'\\', b'\\\\')
+        return b'%s\t%s\tUSGS API\n' % (feature['id'].encode(), raw_json)
+    
+    def read(self, size=-1):
+        while size < 0 or len(self._buffer) < size:
+            row = next(self._rows, None)
+            if row is None:
+                break
+            self._buffer += row
+        
+        if size < 0:
+            size = len(self._buffer)
+        chunk = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return chunk
+
+def read_features(data_path):
+    """
+    Yield features one at a time from an extracted payload file
+    """
+    with gzip.open(data_path, 'rb') as f:
+        yield from ijson.items(f, 'features.item', use_float=True)
+
+def copy_raw_features(cursor, features):
+    """
+    Stream features into a temp staging table with a single COPY,
+    then merge into raw_earthquakes in one statement
+    """
+    cursor.execute("""
+        CREATE TEMP TABLE raw_earthquakes_stage (
+            earthquake_id TEXT,
+            raw_json JSONB,
+            api_source TEXT
+        ) ON COMMIT DROP
+    """)
+    
+    cursor.copy_expert(
+        "COPY raw_earthquakes_stage FROM STDIN WITH (FORMAT text)",
+        FeatureCopyStream(features),
+        size=COPY_BLOCK_BYTES,
+    )
+    
+    # Insert raw data - ON CONFLICT DO NOTHING to handle duplicates
+    cursor.execute("""
+        INSERT INTO raw_earthquakes (earthquake_id, raw_json, api_source)
+        SELECT earthquake_id, raw_json, api_source FROM raw_earthquakes_stage
+        ON CONFLICT (earthquake_id) DO NOTHING
+    """)
+    
+    return cursor.rowcount
+
+def insert_raw_features(cursor, features):
+    """
+    Fallback when COPY is unavailable: multi-row INSERTs in pages of 1000
+    """
+    rows = [(feature['id'], orjson.dumps(feature).decode(), 'USGS API') for feature in features]
+    
+    # Insert raw data - ON CONFLICT DO NOTHING to handle duplicates
+    inserted = execute_values(cursor, """
+        INSERT INTO raw_earthquakes (earthquake_id, raw_json, api_source)
+        VALUES %s
+        ON CONFLICT (earthquake_id) DO NOTHING
+        RETURNING earthquake_id
+    """, rows, page_size=1000, fetch=True)
+    
+    return len(inserted)
+
 def load_raw_data(**context):
     """
     LOAD: Store raw JSON data exactly as received
@@ -73,9 +184,9 @@ def load_raw_data(**context):
     try:
         # Get data from previous task
         ti = context['ti']
-        data = ti.xcom_pull(task_ids='extract_data', key='earthquake_data')
+        data_path = ti.xcom_pull(task_ids='extract_data', key='data_path')
         
-        if not data or 'features' not in data:
+        if not data_path or not os.path.exists(data_path):
             logging.warning("No earthquake data to load")
             return 0
         
@@ -84,20 +195,14 @@ def load_raw_data(**context):
         conn = pg_hook.get_conn()
         cursor = conn.cursor()
         
-        loaded_count = 0
-        
-        for feature in data['features']:
-            earthquake_id = feature['id']
-            raw_json = json.dumps(feature)
-            
-            # Insert raw data - ON CONFLICT DO NOTHING to handle duplicates
-            cursor.execute("""
-                INSERT INTO raw_earthquakes (earthquake_id, raw_json, api_source)
-                VALUES (%s, %s, %s)
-                ON CONFLICT (earthquake_id) DO NOTHING
-            """, (earthquake_id, raw_json, 'USGS API'))
-            
-            loaded_count += cursor.rowcount
+        try:
+            loaded_count = copy_raw_features(cursor, read_features(data_path))
+        except psycopg2.Error as e:
+            # COPY is not supported everywhere (e.g. some proxies and
+            # Postgres-compatible engines) - fall back to batched INSERTs
+            logging.warning(f"COPY load failed, falling back to INSERT: {str(e)}")
+            conn.rollback()
+            loaded_count = insert_raw_features(cursor, read_features(data_path))
         
         conn.commit()
         cursor.close()
@@ -112,6 +217,10 @@ def load_raw_data(**context):
             VALUES (NOW(), %s, 'SUCCESS')
         """, parameters=(loaded_count,))
         
+        # Only remove the payload once the whole task has succeeded, so a
+        # retry after any failure above still finds the file to reload
+        os.remove(data_path)
+        
         return loaded_count
         
     except Exception as e:
@@ -132,6 +241,49 @@ transform_sql = """
 -- TRANSFORM: Clean and enrich data in the database
 -- This runs AFTER load, working with raw data to create analytics table
 
+-- The partitioned table can't have a unique constraint on earthquake_id
+-- alone, so the NOT EXISTS check below is what keeps one row per id. This
+-- self-conflicting lock serializes concurrent transform runs (readers are
+-- not blocked) so two runs can't both pass that check for the same id
+LOCK TABLE analytics_earthquakes IN SHARE ROW EXCLUSIVE MODE;
+
+-- Make sure a monthly partition exists for every month being inserted.
+-- Features without properties.time have no occurred_at, so they can't be
+-- placed in a partition and are skipped here and below
+SELECT create_analytics_partition(month_start::date)
+FROM (
+    SELECT DISTINCT date_trunc(
+        'month', to_timestamp((raw_json->'properties'->>'time')::bigint / 1000)
+    ) as month_start
+    FROM raw_earthquakes
+    WHERE extracted_at >= NOW() - INTERVAL '2 days'
+      AND (raw_json->'properties'->>'time') IS NOT NULL
+) months;
+
+-- Parse each JSONB field once; MATERIALIZED keeps the planner from
+-- inlining the accessors back into every expression below.
+-- earthquake_id is unique in raw_earthquakes, so no DISTINCT is needed
+-- and the range filter is served by idx_raw_extracted_at
+WITH extracted AS MATERIALIZED (
+    SELECT
+        earthquake_id,
+        to_timestamp((raw_json->'properties'->>'time')::bigint / 1000) as occurred_at,
+        (raw_json->'geometry'->'coordinates'->>1)::decimal as latitude,
+        (raw_json->'geometry'->'coordinates'->>0)::decimal as longitude,
+        (raw_json->'geometry'->'coordinates'->>2)::decimal as depth_km,
+        (raw_json->'properties'->>'mag')::decimal as magnitude,
+        raw_json->'properties'->>'magType' as magnitude_type,
+        raw_json->'properties'->>'place' as place
+    FROM raw_earthquakes r
+    WHERE extracted_at >= NOW() - INTERVAL '2 days'
+      AND (raw_json->'properties'->>'time') IS NOT NULL
+      -- Skip events already transformed, so each analytics row is written once
+      -- (idx_analytics_earthquake_id serves this lookup across partitions)
+      AND NOT EXISTS (
+          SELECT 1 FROM analytics_earthquakes a
+          WHERE a.earthquake_id = r.earthquake_id
+      )
+)
 INSERT INTO analytics_earthquakes (
     earthquake_id,
     occurred_at,
@@ -143,66 +295,36 @@ INSERT INTO analytics_earthquakes (
     place,
     country,
     region,
-    magnitude_category,
-    depth_category,
-    risk_level,
-    day_of_week,
-    hour_of_day
+    day_of_week
 )
-SELECT DISTINCT
-    raw_json->>'id' as earthquake_id,
-    to_timestamp((raw_json->'properties'->>'time')::bigint / 1000) as occurred_at,
-    (raw_json->'geometry'->'coordinates'->>1)::decimal as latitude,
-    (raw_json->'geometry'->'coordinates'->>0)::decimal as longitude,
-    (raw_json->'geometry'->'coordinates'->>2)::decimal as depth_km,
-    (raw_json->'properties'->>'mag')::decimal as magnitude,
-    raw_json->'properties'->>'magType' as magnitude_type,
-    raw_json->'properties'->>'place' as place,
+SELECT
+    earthquake_id,
+    occurred_at,
+    latitude,
+    longitude,
+    depth_km,
+    magnitude,
+    magnitude_type,
+    place,
     
-    -- Extract country (simplified)
-    CASE 
-        WHEN raw_json->'properties'->>'place' LIKE '%Mexico%' THEN 'Mexico'
-        WHEN raw_json->'properties'->>'place' LIKE '%California%' THEN 'United States'
-        WHEN raw_json->'properties'->>'place' LIKE '%Japan%' THEN 'Japan'
-        WHEN raw_json->'properties'->>'place' LIKE '%Chile%' THEN 'Chile'
-        ELSE 'Other'
-    END as country,
+    -- Extract country from the keyword lookup table (first match wins)
+    COALESCE(c.country, 'Other') as country,
     
     -- Extract region
-    SPLIT_PART(raw_json->'properties'->>'place', ',', -1) as region,
-    
-    -- Magnitude category
-    CASE 
-        WHEN (raw_json->'properties'->>'mag')::decimal < 3.0 THEN 'Minor'
-        WHEN (raw_json->'properties'->>'mag')::decimal < 5.0 THEN 'Light'
-        WHEN (raw_json->'properties'->>'mag')::decimal < 6.0 THEN 'Moderate'
-        WHEN (raw_json->'properties'->>'mag')::decimal < 7.0 THEN 'Strong'
-        ELSE 'Major'
-    END as magnitude_category,
-    
-    -- Depth category
-    CASE 
-        WHEN (raw_json->'geometry'->'coordinates'->>2)::decimal < 70 THEN 'Shallow'
-        WHEN (raw_json->'geometry'->'coordinates'->>2)::decimal < 300 THEN 'Intermediate'
-        ELSE 'Deep'
-    END as depth_category,
+    SPLIT_PART(place, ',', -1) as region,
     
-    -- Risk level (combination of magnitude and depth)
-    CASE 
-        WHEN (raw_json->'properties'->>'mag')::decimal >= 6.0 
-             AND (raw_json->'geometry'->'coordinates'->>2)::decimal < 70 THEN 'High'
-        WHEN (raw_json->'properties'->>'mag')::decimal >= 5.0 THEN 'Medium'
-        ELSE 'Low'
-    END as risk_level,
-    
-    -- Time analysis
-    TO_CHAR(to_timestamp((raw_json->'properties'->>'time')::bigint / 1000), 'Day') as day_of_week,
-    EXTRACT(HOUR FROM to_timestamp((raw_json->'properties'->>'time')::bigint / 1000)) as hour_of_day
-
-FROM raw_earthquakes
-WHERE extracted_at >= NOW() - INTERVAL '2 days'
-ON CONFLICT (earthquake_id) DO UPDATE SET
-    transformed_at = NOW();
+    -- Time analysis (categories and hour_of_day are generated columns)
+    TO_CHAR(occurred_at, 'Day') as day_of_week
+
+FROM extracted
+LEFT JOIN LATERAL (
+    SELECT country
+    FROM country_keywords
+    WHERE extracted.place LIKE '%' || keyword || '%'
+    ORDER BY priority
+    LIMIT 1
+) c ON true
+ON CONFLICT DO NOTHING;
 """
 
 # Define tasks
@@ -225,5 +347,12 @@ transform_task = PostgresOperator(
     dag=dag,
 )
 
+refresh_dashboard_task = PostgresOperator(
+    task_id='refresh_dashboard_view',
+    postgres_conn_id='postgres_default',
+    sql="REFRESH MATERIALIZED VIEW CONCURRENTLY mv_earthquake_dashboard;",
+    dag=dag,
+)
+
 # Set task dependencies
-extract_task >> load_task >> transform_task
\ No newline at end of file
+extract_task >> load_task >> transform_task >> refresh_dashboard_task
\ No newline at end of file
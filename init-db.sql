@@ -10,11 +10,33 @@ CREATE TABLE IF NOT EXISTS raw_earthquakes (
     api_source VARCHAR(100)
 );
 
--- Create analytics table
+-- Upgrade path for databases created before analytics_earthquakes was
+-- partitioned: park the existing rows, then drop the old table and the
+-- dashboard view so the statements below recreate both. Run the whole file
+-- in one transaction (see README, "Upgrading an Existing Database")
+DO $$
+BEGIN
+    IF EXISTS (
+        SELECT 1 FROM pg_class
+        WHERE relname = 'analytics_earthquakes'
+          AND relnamespace = 'public'::regnamespace
+          AND relkind = 'r'
+    ) THEN
+        CREATE TABLE analytics_earthquakes_legacy AS
+        SELECT earthquake_id, occurred_at, latitude, longitude, depth_km, magnitude,
+               magnitude_type, place, country, region, day_of_week, transformed_at
+        FROM analytics_earthquakes;
+        DROP MATERIALIZED VIEW IF EXISTS mv_earthquake_dashboard;
+        DROP TABLE analytics_earthquakes;
+    END IF;
+END $$;
+
+-- Create analytics table, range-partitioned by month on occurred_at so
+-- time-bounded reads only scan the partitions they need
 CREATE TABLE IF NOT EXISTS analytics_earthquakes (
-    id SERIAL PRIMARY KEY,
-    earthquake_id VARCHAR(50) UNIQUE,
-    occurred_at TIMESTAMP,
+    id SERIAL,
+    earthquake_id VARCHAR(50),
+    occurred_at TIMESTAMP NOT NULL,
     latitude DECIMAL(9,6),
     longitude DECIMAL(9,6),
     depth_km DECIMAL(10,2),
@@ -25,25 +47,125 @@ CREATE TABLE IF NOT EXISTS analytics_earthquakes (
     region VARCHAR(100),
     
     -- Derived columns
-    magnitude_category VARCHAR(20),
-    depth_category VARCHAR(20),
-    risk_level VARCHAR(20),
+    -- Categories are generated from the base columns at write time, so the
+    -- transform only supplies the parsed values
+    magnitude_category VARCHAR(20) GENERATED ALWAYS AS (
+        CASE 
+            WHEN magnitude < 3.0 THEN 'Minor'
+            WHEN magnitude < 5.0 THEN 'Light'
+            WHEN magnitude < 6.0 THEN 'Moderate'
+            WHEN magnitude < 7.0 THEN 'Strong'
+            ELSE 'Major'
+        END
+    ) STORED,
+    depth_category VARCHAR(20) GENERATED ALWAYS AS (
+        CASE 
+            WHEN depth_km < 70 THEN 'Shallow'
+            WHEN depth_km < 300 THEN 'Intermediate'
+            ELSE 'Deep'
+        END
+    ) STORED,
+    risk_level VARCHAR(20) GENERATED ALWAYS AS (
+        CASE 
+            WHEN magnitude >= 6.0 AND depth_km < 70 THEN 'High'
+            WHEN magnitude >= 5.0 THEN 'Medium'
+            ELSE 'Low'
+        END
+    ) STORED,
+    -- TO_CHAR depends on locale settings, so it cannot be a generated column
     day_of_week VARCHAR(10),
-    hour_of_day INTEGER,
+    hour_of_day INTEGER GENERATED ALWAYS AS (EXTRACT(HOUR FROM occurred_at)::integer) STORED,
     
     -- Metadata
     transformed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     
-    -- Indexes for performance
-    CONSTRAINT unique_earthquake_id UNIQUE (earthquake_id)
+    -- Unique constraints on a partitioned table must include the partition key,
+    -- so this no longer rejects a repeated earthquake_id on its own. The
+    -- transform guarantees one row per id instead (see transform_sql)
+    PRIMARY KEY (id, occurred_at),
+    CONSTRAINT unique_earthquake_id UNIQUE (earthquake_id, occurred_at)
+) PARTITION BY RANGE (occurred_at);
+
+-- Create the monthly partition starting at month_start if it is missing
+-- (called by the transform for every month it is about to insert into)
+CREATE OR REPLACE FUNCTION create_analytics_partition(month_start DATE)
+RETURNS VOID AS $$
+BEGIN
+    EXECUTE format(
+        'CREATE TABLE IF NOT EXISTS %I PARTITION OF analytics_earthquakes '
+        'FOR VALUES FROM (%L) TO (%L)',
+        'analytics_earthquakes_' || to_char(month_start, 'YYYY_MM'),
+        month_start,
+        (month_start + INTERVAL '1 month')::date
+    );
+END;
+$$ LANGUAGE plpgsql;
+
+-- Move rows parked by the upgrade block above into their partitions
+DO $$
+BEGIN
+    IF to_regclass('analytics_earthquakes_legacy') IS NOT NULL THEN
+        PERFORM create_analytics_partition(month_start::date)
+        FROM (
+            SELECT DISTINCT date_trunc('month', occurred_at) AS month_start
+            FROM analytics_earthquakes_legacy
+            WHERE occurred_at IS NOT NULL
+        ) months;
+
+        -- Categories and hour_of_day are regenerated from the base columns
+        INSERT INTO analytics_earthquakes (
+            earthquake_id, occurred_at, latitude, longitude, depth_km, magnitude,
+            magnitude_type, place, country, region, day_of_week, transformed_at
+        )
+        SELECT earthquake_id, occurred_at, latitude, longitude, depth_km, magnitude,
+               magnitude_type, place, country, region, day_of_week, transformed_at
+        FROM analytics_earthquakes_legacy
+        WHERE occurred_at IS NOT NULL;
+
+        DROP TABLE analytics_earthquakes_legacy;
+    END IF;
+END $$;
+
+-- Create country lookup table used by the transform
+-- Keywords are matched against the USGS place string in priority order
+CREATE TABLE IF NOT EXISTS country_keywords (
+    keyword VARCHAR(100) PRIMARY KEY,
+    country VARCHAR(100) NOT NULL,
+    priority INTEGER NOT NULL
 );
 
+INSERT INTO country_keywords (keyword, country, priority) VALUES
+    ('Mexico', 'Mexico', 1),
+    ('California', 'United States', 2),
+    ('Japan', 'Japan', 3),
+    ('Chile', 'Chile', 4)
+ON CONFLICT (keyword) DO NOTHING;
+
 -- Create indexes
 CREATE INDEX IF NOT EXISTS idx_raw_extracted_at ON raw_earthquakes(extracted_at);
+CREATE INDEX IF NOT EXISTS idx_analytics_earthquake_id ON analytics_earthquakes(earthquake_id);
 CREATE INDEX IF NOT EXISTS idx_analytics_occurred_at ON analytics_earthquakes(occurred_at);
 CREATE INDEX IF NOT EXISTS idx_analytics_magnitude ON analytics_earthquakes(magnitude);
 CREATE INDEX IF NOT EXISTS idx_analytics_region ON analytics_earthquakes(region);
 
+-- Pre-aggregated counts for the dashboard, refreshed at the end of each DAG run
+CREATE MATERIALIZED VIEW IF NOT EXISTS mv_earthquake_dashboard AS
+SELECT
+    magnitude_category,
+    risk_level,
+    country,
+    depth_category,
+    hour_of_day,
+    occurred_at::date AS day,
+    COUNT(*) AS earthquake_count
+FROM analytics_earthquakes
+GROUP BY 1, 2, 3, 4, 5, 6;
+
+-- REFRESH ... CONCURRENTLY requires a unique index on the view
+CREATE UNIQUE INDEX IF NOT EXISTS idx_mv_dashboard_group ON mv_earthquake_dashboard (
+    magnitude_category, risk_level, country, depth_category, hour_of_day, day
+);
+
 -- Create load history table for incremental loads
 CREATE TABLE IF NOT EXISTS load_history (
     id SERIAL PRIMARY KEY,
@@ -52,4 +174,29 @@ CREATE TABLE IF NOT EXISTS load_history (
     status VARCHAR(20),
     error_message TEXT,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-);
\ No newline at end of file
+);
+
+-- An earlier export_watermark was keyed by table name only, which can't
+-- tell .csv and .csv.gz exports of the same table apart. Drop it; the next
+-- export just rewrites its files in full
+DO $$
+BEGIN
+    IF to_regclass('export_watermark') IS NOT NULL AND NOT EXISTS (
+        SELECT 1 FROM information_schema.columns
+        WHERE table_schema = current_schema()
+          AND table_name = 'export_watermark'
+          AND column_name = 'export_path'
+    ) THEN
+        DROP TABLE export_watermark;
+    END IF;
+END $$;
+
+-- Last exported row timestamp and size per export file, used by
+-- scripts/export_data.py for incremental exports and file preallocation
+CREATE TABLE IF NOT EXISTS export_watermark (
+    export_path VARCHAR(255) PRIMARY KEY,
+    table_name VARCHAR(100) NOT NULL,
+    last_exported_ts TIMESTAMP NOT NULL,
+    bytes_written BIGINT,
+    exported_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
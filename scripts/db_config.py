@@ -0,0 +1,28 @@
+# Shared PostgreSQL connection settings for the scripts in this folder
+import os
+from urllib.parse import quote, urlencode
+from psycopg2.extensions import parse_dsn
+
+# libpq connection string; override PG_DSN to point the scripts elsewhere
+PG_DSN = os.environ.get(
+    'PG_DSN', "host=localhost port=5432 dbname=airflow user=airflow password=airflow"
+)
+
+# Extra libpq parameters for every connection:
+# - TCP keepalives stop idle pooled connections from being dropped by
+#   firewalls/NAT, which would force a fresh handshake on reuse
+# - no statement timeout, so long COPY exports aren't cancelled mid-stream
+PG_CONNECT_OPTIONS = {
+    'keepalives': 1,
+    'keepalives_idle': 30,
+    'keepalives_interval': 10,
+    'keepalives_count': 5,
+    'options': '-c statement_timeout=0',
+}
+
+# The same settings as a libpq URI, for drivers that only take a URI (ADBC).
+# Every parameter goes in the query string, which libpq accepts for all of
+# them, so hosts such as socket directories need no special escaping.
+# libpq doesn't decode '+' as a space, hence quote instead of quote_plus
+PG_URI = "postgresql://?" + urlencode({**parse_dsn(PG_DSN), **PG_CONNECT_OPTIONS},
+                                      quote_via=quote)
@@ -1,33 +1,289 @@
-import pandas as pd
 import psycopg2
+from psycopg2.pool import ThreadedConnectionPool
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from itertools import repeat
+import csv
+import gzip
+import io
 import os
+from db_config import PG_DSN, PG_CONNECT_OPTIONS
 
-# Crear carpeta data si no existe
-os.makedirs('data', exist_ok=True)
-
-print("Connecting to PostgreSQL...")
-conn = psycopg2.connect(
-    host="localhost",
-    port=5432,
-    database="airflow",
-    user="airflow",
-    password="airflow"
-)
-
-print("Exporting raw_earthquakes...")
-df_raw = pd.read_sql("SELECT * FROM raw_earthquakes", conn)
-df_raw.to_csv('data/raw_earthquakes.csv', index=False)
-print(f"✅ Exported {len(df_raw)} rows to data/raw_earthquakes.csv")
-
-print("Exporting analytics_earthquakes...")
-df_analytics = pd.read_sql("SELECT * FROM analytics_earthquakes", conn)
-df_analytics.to_csv('data/analytics_earthquakes.csv', index=False)
-print(f"✅ Exported {len(df_analytics)} rows to data/analytics_earthquakes.csv")
-
-print("Exporting load_history...")
-df_history = pd.read_sql("SELECT * FROM load_history", conn)
-df_history.to_csv('data/load_history.csv', index=False)
-print(f"✅ Exported {len(df_history)} rows to data/load_history.csv")
-
-conn.close()
-print("\n🎉 All data exported successfully!")
\ No newline at end of file
+# Rows fetched per round-trip when streaming through a server-side cursor
+FETCH_SIZE = 50000
+
+# User-space write buffer for export files, so multi-MB CSVs go to disk in
+# a few large writes instead of thousands of 8 KiB ones
+WRITE_BUFFER_SIZE = 8 * 1024 * 1024
+
+# Set EXPORT_COMPRESSION=gzip to write .csv.gz files. Level 1 favours
+# speed; CSV still shrinks several-fold, so far fewer bytes hit the disk
+EXPORT_COMPRESSION = os.environ.get('EXPORT_COMPRESSION', '')
+GZIP_LEVEL = 1
+
+# Set EXPORT_FORMAT=binary when the files will be reloaded into PostgreSQL:
+# COPY's binary format skips number/timestamp <-> text conversion on both
+# ends. CSV stays the default for human-facing output
+EXPORT_FORMAT = os.environ.get('EXPORT_FORMAT', 'csv')
+EXPORT_EXTENSION = (('.bin' if EXPORT_FORMAT == 'binary' else '.csv')
+                    + ('.gz' if EXPORT_COMPRESSION == 'gzip' else ''))
+
+# Set EXPORT_MODE=incremental to append only the rows added since the last
+# export (tracked per table in export_watermark) instead of rewriting every
+# file from scratch. Full exports also record the watermark when the table
+# exists, but don't need it
+EXPORT_MODE = os.environ.get('EXPORT_MODE', 'full')
+
+# Column used as the export watermark for each table
+EXPORT_TIMESTAMPS = {
+    'raw_earthquakes': 'extracted_at',
+    'analytics_earthquakes': 'transformed_at',
+    'load_history': 'created_at',
+}
+
+# Output file for a table under the current format/compression settings.
+# Watermarks are kept per file: a mark saved by a .csv.gz export says
+# nothing about what a .csv file next to it contains
+def export_path(table):
+    return f"data/{table}{EXPORT_EXTENSION}"
+
+# Headroom over the previous run's file size when preallocating a full export
+PREALLOCATE_FACTOR = 1.1
+
+# Reserve disk blocks for the expected file size up front, so the
+# filesystem doesn't extend the file block by block while COPY streams in.
+# Best effort: not every platform or filesystem supports it
+def preallocate_file(f, size):
+    if size and hasattr(os, 'posix_fallocate'):
+        try:
+            os.posix_fallocate(f.fileno(), 0, size)
+            return True
+        except OSError:
+            pass
+    return False
+
+# Open an export target for writing, compressing on the fly when enabled.
+# COPY writes bytes; the csv.writer fallback needs a text stream
+@contextmanager
+def open_export_file(path, text=False, append=False, preallocate=0):
+    # Appending works for gzip too: a file of concatenated gzip members is valid
+    with open(path, 'ab' if append else 'wb', buffering=WRITE_BUFFER_SIZE) as raw:
+        start = raw.tell()
+        preallocated = not append and preallocate_file(raw, preallocate)
+        try:
+            if EXPORT_COMPRESSION == 'gzip':
+                with gzip.open(raw, 'wt' if text else 'wb', compresslevel=GZIP_LEVEL,
+                               newline='' if text else None) as f:
+                    yield f
+            elif text:
+                f = io.TextIOWrapper(raw, newline='')
+                try:
+                    yield f
+                finally:
+                    # Flush the text layer and hand raw back without closing it
+                    f.detach()
+            else:
+                yield raw
+        except BaseException:
+            # Cut a failed write back to where it started: an append must not
+            # leave rows for the fallback or the next run to append again, and
+            # a full export must not leave a preallocated tail of NUL bytes
+            # that looks like a complete file
+            raw.truncate(start)
+            raise
+        if preallocated:
+            # Drop whatever part of the reservation wasn't written
+            raw.truncate()
+
+# Stream a table straight from PostgreSQL's COPY output into a file,
+# without building an intermediate DataFrame
+def export_table(conn, table, path, query, append=False, preallocate=0):
+    if EXPORT_FORMAT == 'binary':
+        options = '(FORMAT binary)'
+    else:
+        options = 'CSV' if append else 'CSV HEADER'
+    try:
+        with conn.cursor() as cursor, open_export_file(path, append=append, preallocate=preallocate) as f:
+            cursor.copy_expert(f"COPY ({query}) TO STDOUT WITH {options}", f)
+            return cursor.rowcount
+    except psycopg2.Error as e:
+        # Binary format only exists through COPY, there is nothing to fall back to
+        if EXPORT_FORMAT == 'binary':
+            raise
+        # COPY is not supported everywhere - fall back to streaming rows
+        print(f"⚠️  COPY failed for {table}, streaming rows instead: {e}")
+        conn.rollback()
+        return stream_table_rows(conn, table, path, query, append, preallocate)
+
+# Fallback export through a named (server-side) cursor, so rows arrive in
+# FETCH_SIZE batches instead of the whole result set being buffered
+# client-side
+def stream_table_rows(conn, table, path, query, append=False, preallocate=0):
+    # Read every column as PostgreSQL's own text output - the same text COPY
+    # writes - rather than psycopg2's Python objects (a JSONB value would
+    # otherwise come out as a dict repr)
+    with conn.cursor() as cursor:
+        cursor.execute(f"SELECT * FROM ({query}) q LIMIT 0")
+        columns = [column.name for column in cursor.description]
+    text_columns = ", ".join(f'q."{name}"::text AS "{name}"' for name in columns)
+
+    with conn.cursor(name=f"export_{table}") as cursor, \
+            open_export_file(path, text=True, append=append, preallocate=preallocate) as f:
+        cursor.itersize = FETCH_SIZE
+        cursor.execute(f"SELECT {text_columns} FROM ({query}) q")
+        # COPY ends rows with a bare newline
+        writer = csv.writer(f, lineterminator='\n')
+        if not append:
+            writer.writerow(columns)
+
+        row_count = 0
+        rows = cursor.fetchmany(FETCH_SIZE)
+        while rows:
+            writer.writerows(rows)
+            row_count += len(rows)
+            rows = cursor.fetchmany(FETCH_SIZE)
+    return row_count
+
+# Read each table's last exported watermark and file size, plus its current
+# high-water mark. Exporting up to a fixed upper bound keeps rows inserted
+# mid-export for the next run instead of exporting them twice.
+#
+# Known gap: the watermark columns default to CURRENT_TIMESTAMP, which is the
+# start of the writing transaction. A row from a long transaction that
+# commits after a later one has already been exported gets a timestamp
+# below the saved watermark and is never picked up by incremental mode.
+# A periodic full export catches such rows
+def get_export_ranges(conn):
+    with conn.cursor() as cursor:
+        # Databases created before export_watermark existed can still run
+        # full exports; see README for the upgrade step
+        cursor.execute("SELECT to_regclass('export_watermark') IS NOT NULL")
+        has_watermarks = cursor.fetchone()[0]
+        watermarks = {}
+        if has_watermarks:
+            cursor.execute("SELECT export_path, last_exported_ts, bytes_written FROM export_watermark")
+            watermarks = {path: (ts, size) for path, ts, size in cursor.fetchall()}
+        ranges = {}
+        for table, column in EXPORT_TIMESTAMPS.items():
+            low, previous_bytes = watermarks.get(export_path(table), (None, None))
+            cursor.execute(f"SELECT MAX({column}) FROM {table}")
+            ranges[table] = (low, cursor.fetchone()[0], previous_bytes)
+    conn.commit()
+    return has_watermarks, ranges
+
+# Build the SELECT for one table's slice, inlining the bounds with mogrify
+def build_export_query(conn, table, low, high):
+    column = EXPORT_TIMESTAMPS[table]
+    conditions = []
+    columns = "*"
+    with conn.cursor() as cursor:
+        if EXPORT_FORMAT == 'binary':
+            # Binary files are for reloading with COPY FROM, which can't write
+            # GENERATED columns - export only the columns it can load
+            cursor.execute("""
+                SELECT column_name FROM information_schema.columns
+                WHERE table_schema = current_schema() AND table_name = %s
+                  AND is_generated = 'NEVER'
+                ORDER BY ordinal_position
+            """, (table,))
+            columns = ", ".join(name for (name,) in cursor.fetchall())
+        if low is not None:
+            conditions.append(cursor.mogrify(f"{column} > %s", (low,)).decode())
+        if high is not None:
+            upper = cursor.mogrify(f"{column} <= %s", (high,)).decode()
+            # A full rewrite (no lower bound) keeps rows with no timestamp;
+            # they have no place in an incremental slice
+            conditions.append(upper if low is not None else f"({upper} OR {column} IS NULL)")
+    where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+    return f"SELECT {columns} FROM {table}{where}"
+
+# Record the new high-water mark and size of a table's export file
+def save_watermark(conn, table, path, high, bytes_written):
+    with conn.cursor() as cursor:
+        cursor.execute("""
+            INSERT INTO export_watermark (export_path, table_name, last_exported_ts, bytes_written, exported_at)
+            VALUES (%s, %s, %s, %s, CURRENT_TIMESTAMP)
+            ON CONFLICT (export_path) DO UPDATE
+            SET last_exported_ts = EXCLUDED.last_exported_ts,
+                bytes_written = EXCLUDED.bytes_written,
+                exported_at = EXCLUDED.exported_at
+        """, (path, table, high, bytes_written))
+    conn.commit()
+
+TABLES = list(EXPORT_TIMESTAMPS)
+
+# Created on first use and shared by every export in this process, so
+# importing the module doesn't open connections and repeated exports don't
+# pay the connect/auth handshake again. One connection per table lets the
+# exports run side by side
+_POOL = None
+
+def _get_pool():
+    global _POOL
+    if _POOL is None:
+        _POOL = ThreadedConnectionPool(1, len(TABLES), PG_DSN, **PG_CONNECT_OPTIONS)
+    return _POOL
+
+def close_pool():
+    global _POOL
+    if _POOL is not None:
+        _POOL.closeall()
+        _POOL = None
+
+@contextmanager
+def pooled_connection():
+    pool = _get_pool()
+    conn = pool.getconn()
+    try:
+        yield conn
+    finally:
+        pool.putconn(conn)
+
+def export_pooled(table, export_range, has_watermarks):
+    path = export_path(table)
+    low, high, previous_bytes = export_range
+    # Full exports, and tables whose file is missing, are rewritten from scratch
+    append = EXPORT_MODE == 'incremental' and low is not None and os.path.exists(path)
+    if not append:
+        low = None
+    preallocate = int((previous_bytes or 0) * PREALLOCATE_FACTOR)
+    with pooled_connection() as conn:
+        query = build_export_query(conn, table, low, high)
+        row_count = export_table(conn, table, path, query, append, preallocate)
+        # Saved as soon as this table's file is complete, so a failure in
+        # another table's export can't make the next run append these rows again
+        if has_watermarks and high is not None:
+            save_watermark(conn, table, path, high, os.path.getsize(path))
+    return path, row_count
+
+def main():
+    if EXPORT_MODE == 'incremental' and EXPORT_FORMAT == 'binary':
+        # Each binary COPY has its own header and trailer, so files can't be appended to
+        raise SystemExit("EXPORT_MODE=incremental is not supported with EXPORT_FORMAT=binary")
+
+    # Crear carpeta data si no existe
+    os.makedirs('data', exist_ok=True)
+
+    print("Connecting to PostgreSQL...")
+    try:
+        with pooled_connection() as conn:
+            has_watermarks, ranges = get_export_ranges(conn)
+        if EXPORT_MODE == 'incremental' and not has_watermarks:
+            raise SystemExit("EXPORT_MODE=incremental needs the export_watermark table; "
+                             "re-run init-db.sql (see README)")
+
+        # Exports are network- and disk-bound and libpq releases the GIL, so
+        # threads overlap the three transfers instead of running them back to back
+        print(f"Exporting {', '.join(TABLES)}...")
+        with ThreadPoolExecutor(max_workers=len(TABLES)) as executor:
+            results = executor.map(export_pooled, TABLES, [ranges[table] for table in TABLES],
+                                   repeat(has_watermarks))
+            for path, row_count in results:
+                print(f"✅ Exported {row_count} rows to {path}")
+
+        print("\n🎉 All data exported successfully!")
+    finally:
+        close_pool()
+
+if __name__ == '__main__':
+    main()